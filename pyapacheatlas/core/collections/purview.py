@@ -1,11 +1,15 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import enum
 import logging
 from typing import List, Union
 
 from ..entity import AtlasEntity
-from ..util import _handle_response, AtlasBaseClient, batch_dependent_entities
+from ..util import _handle_response, _json_dumps, AtlasBaseClient, batch_dependent_entities
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 #me
 from anytree import Node, RenderTree, AsciiStyle
@@ -27,6 +31,43 @@ class PurviewCollectionsClient(AtlasBaseClient):
         super().__init__(**kwargs)
         self.endpoint_url = endpoint_url
         self.authentication = authentication
+        # Reuse connections to the purview endpoint across calls.
+        # requests already negotiates gzip (and br when brotli is installed)
+        self._session = requests.Session()
+        self._session.headers.update({"Accept": "application/json"})
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET", "POST", "PUT"],
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+        ))
+
+    def _post_json(self, url, payload, params=None):
+        """
+        POST a json payload, serializing it with orjson when available.
+
+        :param str url: The endpoint to post to.
+        :param payload: The json serializable body of the request.
+        :param dict params: The query parameters of the request.
+        :return: The response of the request.
+        :rtype: requests.Response
+        """
+        # Read per request so expired tokens are refreshed mid upload
+        headers = self.authentication.get_authentication_headers()
+        headers["Content-Type"] = "application/json"
+        return self._session.post(
+            url,
+            data=_json_dumps(payload),
+            params=params,
+            headers=headers,
+            **self._requests_args
+        )
 
     def upload_single_entity(
         self,
@@ -59,12 +100,10 @@ class PurviewCollectionsClient(AtlasBaseClient):
         else:
             raise ValueError("entity should be an AtlasEntity or dict")
 
-        singleEntityResponse = requests.post(
+        singleEntityResponse = self._post_json(
             atlas_endpoint,
-            json = payload,
-            params = {"api-version": api_version},
-            headers = self.authentication.get_authentication_headers(),
-            **self._requests_args
+            payload,
+            params = {"api-version": api_version}
         )
         results = _handle_response(singleEntityResponse)
         return results
@@ -74,7 +113,8 @@ class PurviewCollectionsClient(AtlasBaseClient):
         batch : List[AtlasEntity],
         collection : str,
         batch_size : int = None,
-        api_version : str = "2022-03-01-preview"
+        api_version : str = "2022-03-01-preview",
+        max_workers : int = None
     ):
         """
         Creates or updates a batch of atlas entities in a purview collection.
@@ -94,44 +134,86 @@ class PurviewCollectionsClient(AtlasBaseClient):
             e.g. by visual inspection in the purview web UI (https://web.purview.azure.com/).
         :param int batch_size: The number of entities you want to send in bulk.
         :param str api_version: The Purview API version to use.
-        :return: An entity mutation response.
-        :rtype: dict
+        :param int max_workers:
+            The maximum number of batches uploaded concurrently when
+            batch_size splits the upload into several requests. Defaults to
+            None, which like 0 or 1 uploads one batch at a time.
+        :return:
+            An entity mutation response or, when batched, a list of entity
+            mutation responses in batch order.
+        :rtype: Union(dict, list(dict))
+
+        When batched, the first failing batch stops the upload: no further
+        batches are sent and its exception is raised. Every batch before the
+        failing one has been written, and up to max_workers - 1 batches after
+        it that were already in flight may have been written as well.
         """
 
         atlas_endpoint = self.endpoint_url + f"catalog/api/collections/{collection}/entity/bulk"
 
         payload = PurviewCollectionsClient._prepare_entity_upload(batch)
+        params = {"api-version": api_version}
+        entity_count = len(payload["entities"])
         results = []
-        if batch_size and len(payload["entities"]) > batch_size:
-            batches = [{"entities": x} for x in batch_dependent_entities(
-                payload["entities"], batch_size=batch_size)]
-
-            for batch_id, batch in enumerate(batches):
-                batch_size = len(batch["entities"])
-                logging.debug(f"Batch upload #{batch_id} of size {batch_size}")
-                postBulkEntities = requests.post(
-                    atlas_endpoint,
-                    json=batch,
-                    params = {"api-version": api_version},
-                    headers=self.authentication.get_authentication_headers(),
-                    **self._requests_args
-                )
-                temp_results = _handle_response(postBulkEntities)
-                results.append(temp_results)
+        if batch_size and entity_count > batch_size:
+            batches = batch_dependent_entities(
+                payload["entities"], batch_size=batch_size)
+
+            results = self._post_batches(
+                atlas_endpoint, params, batches, max_workers)
 
         else:
-            postBulkEntities = requests.post(
+            postBulkEntities = self._post_json(
                 atlas_endpoint,
-                json=payload,
-                params = {"api-version": api_version},
-                headers=self.authentication.get_authentication_headers(),
-                **self._requests_args
+                payload,
+                params = params
             )
 
             results = _handle_response(postBulkEntities)
 
         return results
     
+    def _post_batches(self, atlas_endpoint, params, batches, max_workers):
+        """
+        Upload the batches of an `upload_entities` call with at most
+        `max_workers` requests in flight, returning results in batch order.
+        A batch is only submitted once an earlier one has been collected,
+        so nothing new is sent after a failure.
+        """
+        workers = max(1, min(max_workers or 1, len(batches)))
+        results = []
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for batch_id, sub_batch in enumerate(batches):
+                    if len(in_flight) == workers:
+                        results.append(in_flight.popleft().result())
+                    in_flight.append(executor.submit(
+                        self._post_bulk, atlas_endpoint, params,
+                        batch_id, {"entities": sub_batch}
+                    ))
+                while in_flight:
+                    results.append(in_flight.popleft().result())
+            except BaseException:
+                # AtlasException derives from BaseException
+                for future in in_flight:
+                    future.cancel()
+                raise
+        return results
+
+    def _post_bulk(self, atlas_endpoint, params, batch_id, batch):
+        """
+        Upload a single batch of an `upload_entities` call.
+        """
+        batch_size = len(batch["entities"])
+        logging.debug("Batch upload #%d of size %d", batch_id, batch_size)
+        postBulkEntities = self._post_json(
+            atlas_endpoint,
+            batch,
+            params = params
+        )
+        return _handle_response(postBulkEntities)
+
     # TODO: This is duplication with the AtlasClient and should eventually be removed
     @staticmethod
     def _prepare_entity_upload(batch):
@@ -155,10 +237,8 @@ class PurviewCollectionsClient(AtlasBaseClient):
                 e, AtlasEntity) else e for e in batch]
             payload = {"entities": dict_batch}
         elif isinstance(batch, dict):
-            current_keys = list(batch.keys())
-
             # Does the dict entity conform to the required pattern?
-            if not any([req in current_keys for req in required_keys]):
+            if not any(req in batch for req in required_keys):
                 # Assuming this is a single entity
                 # DESIGN DECISION: I'm assuming, if you're passing in
                 # json, you know the schema and I will not support
@@ -195,45 +275,60 @@ class PurviewCollectionsClient(AtlasBaseClient):
 
         atlas_endpoint = self.endpoint_url + f"catalog/api/collections/{collection}/entity/moveHere"
 
-        singleEntityResponse = requests.post(
+        singleEntityResponse = self._post_json(
             atlas_endpoint,
-            json = {"entityGuids":guids},
-            params = {"api-version": api_version},
-            headers = self.authentication.get_authentication_headers(),
-            **self._requests_args
+            {"entityGuids":guids},
+            params = {"api-version": api_version}
         )
         results = _handle_response(singleEntityResponse)
         return results
 
-    def _list_collections_generator(self, initial_endpoint):
+    def _get_collections_page(self, endpoint):
         """
-        Generator to page through the list collections response
+        Retrieve and parse a single page of the list collections response.
         """
-        updated_endpoint = initial_endpoint
-        while True:
-            if updated_endpoint is None:
-                return
-            collectionsListGet = requests.get(
-                updated_endpoint,
-                headers = self.authentication.get_authentication_headers(),
-                **self._requests_args
-            )
+        collectionsListGet = self._session.get(
+            endpoint,
+            headers = self.authentication.get_authentication_headers(),
+            **self._requests_args
+        )
 
-            results = _handle_response(collectionsListGet)
+        return _handle_response(collectionsListGet)
 
-            return_values = results["value"]
-            return_count = len(return_values)
-            updated_endpoint = results.get("nextLink")
+    def _list_collections_generator(self, initial_endpoint):
+        """
+        Generator to page through the list collections response.
+        The next page is requested in the background while the
+        current page is being consumed.
+
+        Because of the lookahead, the page after the one being consumed
+        has always been requested, even if the caller stops early. A
+        generator abandoned part-way without being closed keeps its idle
+        worker thread until it is garbage collected.
+        """
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_page = prefetcher.submit(
+                self._get_collections_page, initial_endpoint)
+            while True:
+                if next_page is None:
+                    return
+
+                results = next_page.result()
 
-            if return_count == 0:
-                return
+                return_values = results["value"]
+                return_count = len(return_values)
+                updated_endpoint = results.get("nextLink")
 
-            for sub_result in return_values:
-                try:
-                    yield sub_result
-                except StopIteration:
+                if return_count == 0:
                     return
 
+                next_page = None
+                if updated_endpoint is not None:
+                    next_page = prefetcher.submit(
+                        self._get_collections_page, updated_endpoint)
+
+                yield from return_values
+
     def list_collections(
         self,
         api_version : str = "2019-11-01-preview",
@@ -279,58 +374,53 @@ class PurviewCollectionsClient(AtlasBaseClient):
         if skipToken:
             atlas_endpoint = atlas_endpoint + f"&$skipToken={skipToken}"
         
-        collection_list_request = requests.get(
-            url=atlas_endpoint,
-            headers=self.authentication.get_authentication_headers()
-        )
-        collection_list = collection_list_request.json()["value"]
-        if hierarchy:
-            self._hierarchy()
-
-        elif only_names:
-            friendly_names_list = [coll["friendlyName"] for coll in collection_list]
+        collection_generator = self._list_collections_generator(atlas_endpoint)
+        if only_names and not hierarchy:
+            # Collections are consumed page by page so only the
+            # friendly names outlive their page
+            friendly_names_list = [coll["friendlyName"] for coll in collection_generator]
             return friendly_names_list
 
+        collection_list = list(collection_generator)
+        if hierarchy:
+            self._hierarchy(self._build_collection_names(collection_list))
+
         return collection_list
 
     def _get_final_collection_names(self):
-        collection_list = self.list_collections_new()
-
-        final_collection_list = {}
-        for index, coll in enumerate(collection_list):
-            if "parentCollection" not in coll:
-                final_collection_list[coll["name"]] = {
-                    "friendlyName": coll["friendlyName"], 
-                    "index": index, 
-                    "parentCollection": None
-                }
-            else:
-                final_collection_list[coll["name"]] = {
-                    "friendlyName": coll["friendlyName"], 
-                    "index": index, 
-                    "parentCollection": coll['parentCollection']['referenceName']
-                }
+        # Build the mapping while paging instead of from a materialized list
+        return self._build_collection_names(self.list_collections())
+
+    @staticmethod
+    def _build_collection_names(collections):
+        final_collection_list = {
+            coll["name"]: {
+                "friendlyName": coll["friendlyName"],
+                "index": index,
+                "parentCollection": coll.get("parentCollection", {}).get("referenceName")
+            }
+            for index, coll in enumerate(collections)
+        }
         return final_collection_list
 
     
-    def _hierarchy(self):
-        collection_list = self._get_final_collection_names()
-        for index, coll in enumerate(collection_list.items()):
-            real_name = coll[0]
-            friendly_name = coll[1]["friendlyName"]
-            parent_collection = coll[1]["parentCollection"]
-
-            if index == 0:
-                root = Node(name=friendly_name)
-                root_name = real_name 
-            
-            elif index != 0 and parent_collection == root_name:
-                child = Node(name=friendly_name, parent=root)
+    def _hierarchy(self, collection_list):
+        nodes = {
+            real_name: Node(name=coll["friendlyName"])
+            for real_name, coll in collection_list.items()
+        }
+
+        roots = []
+        for real_name, coll in collection_list.items():
+            parent_collection = coll["parentCollection"]
+            if parent_collection in nodes:
+                nodes[real_name].parent = nodes[parent_collection]
             else:
-                child = Node(name=friendly_name, parent=child)
-        
-        for pre, _, node in RenderTree(node=root, style=AsciiStyle()):
-            print("%s%s" % (pre, node.name))
+                roots.append(nodes[real_name])
+
+        for root in roots:
+            for pre, _, node in RenderTree(node=root, style=AsciiStyle()):
+                print("%s%s" % (pre, node.name))
 
 
 
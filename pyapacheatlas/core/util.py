@@ -1,10 +1,17 @@
 from functools import wraps
 import json
 from json import JSONDecodeError
+import logging
 import re
 import warnings
 
 import requests
+_ORJSON_INSTALLED = False
+try:
+    import orjson
+    _ORJSON_INSTALLED = True
+except ImportError:
+    pass
 
 
 class AtlasBaseClient():
@@ -193,7 +200,7 @@ def batch_dependent_entities(entities, batch_size=1000):
 
     sets = []
 
-    print(f"Number of entities: {len(entities)}")
+    logging.debug("Number of entities: %d", len(entities))
 
     for idx, entity in enumerate(entities):
         candidate_sets = []
@@ -362,6 +369,21 @@ def batch_dependent_entities(entities, batch_size=1000):
 
     return output_batches
 
+def _json_dumps(payload):
+    """
+    Serialize a payload to a UTF-8 encoded json body, using orjson when it
+    is installed and falling back to the standard library otherwise.
+
+    :param payload: The json serializable object to encode.
+    :return: The encoded json body.
+    :rtype: bytes
+    """
+    if _ORJSON_INSTALLED:
+        # Accept the same non-str dict keys that json.dumps does
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload).encode("utf-8")
+
+
 def _handle_response(resp):
     """
     Safely handle an Atlas Response and return the results if valid.
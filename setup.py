@@ -59,8 +59,12 @@ def setup_package():
         packages=setuptools.find_packages(),
         install_requires=[
             'openpyxl>=3.0',
-            'requests>=2.0'
+            'requests>=2.25',
+            'urllib3>=1.26'
         ],
+        extras_require={
+            'orjson': ['orjson']
+        },
         classifiers=[
             "Programming Language :: Python :: 3",
             "License :: OSI Approved :: MIT License",
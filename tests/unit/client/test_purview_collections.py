@@ -0,0 +1,285 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from pyapacheatlas.core import AtlasEntity, AtlasException, AtlasProcess
+from pyapacheatlas.core.collections import PurviewCollectionsClient
+
+
+class RotatingTokenAuth():
+    """
+    Hands out a new token on every call, like an auth class whose token
+    keeps expiring.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def get_authentication_headers(self):
+        self.calls += 1
+        return {"Authorization": f"Bearer token{self.calls}"}
+
+
+def _echo_response(body, status_code=200):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(body).encode("utf-8")
+    return resp
+
+
+def _sample_entities(count):
+    return [
+        AtlasEntity(f"name{i}", "DataSet", f"pyapacheatlas://name{i}", guid=-1-i)
+        for i in range(count)
+    ]
+
+
+def test_prepare_entity_upload_homogeneous_list():
+    entities = [
+        AtlasEntity(f"name{i}", "DataSet", f"pyapacheatlas://name{i}", guid=-1-i)
+        for i in range(3)
+    ]
+
+    results = PurviewCollectionsClient._prepare_entity_upload(entities)
+
+    assert(results == {"entities": [e.to_json() for e in entities]})
+
+
+def test_prepare_entity_upload_mixed_list():
+    entity = AtlasEntity("name", "DataSet", "pyapacheatlas://name", guid=-1)
+    process = AtlasProcess(
+        "proc", "Process", "pyapacheatlas://proc", inputs=[entity],
+        outputs=[], guid=-2
+    )
+    raw = AtlasEntity("raw", "DataSet", "pyapacheatlas://raw", guid=-3).to_json()
+
+    results = PurviewCollectionsClient._prepare_entity_upload(
+        [entity, process, raw])
+
+    assert(results == {"entities": [entity.to_json(), process.to_json(), raw]})
+
+
+def test_prepare_entity_upload_empty_list():
+    results = PurviewCollectionsClient._prepare_entity_upload([])
+
+    assert(results == {"entities": []})
+
+
+def test_hierarchy_nests_by_parent_collection(capsys):
+    client = PurviewCollectionsClient("https://demo.purview.azure.com/", None)
+    collection_names = {
+        "demo": {"friendlyName": "Demo", "index": 0, "parentCollection": None},
+        "abc123": {"friendlyName": "Sales", "index": 1, "parentCollection": "demo"},
+        "def456": {"friendlyName": "Finance", "index": 2, "parentCollection": "demo"},
+        "ghi789": {"friendlyName": "Orders", "index": 3, "parentCollection": "abc123"},
+    }
+
+    client._hierarchy(collection_names)
+
+    assert(capsys.readouterr().out.splitlines() == [
+        "Demo",
+        "|-- Sales",
+        "|   +-- Orders",
+        "+-- Finance",
+    ])
+
+
+def test_prepare_entity_upload_dict():
+    entity = AtlasEntity("name", "DataSet", "pyapacheatlas://name", guid=-1).to_json()
+    shaped = {"entities": [entity]}
+
+    assert(PurviewCollectionsClient._prepare_entity_upload(shaped) is shaped)
+    assert(PurviewCollectionsClient._prepare_entity_upload(entity) == shaped)
+
+
+def test_upload_entities_reads_headers_per_batch():
+    client = PurviewCollectionsClient(
+        "https://demo.purview.azure.com/", RotatingTokenAuth())
+    sent_tokens = []
+
+    def post(url, data=None, params=None, headers=None, **kwargs):
+        sent_tokens.append(headers["Authorization"])
+        return _echo_response({"mutatedEntities": {}})
+    client._session.post = post
+
+    client.upload_entities(
+        _sample_entities(6), "abc123", batch_size=2, max_workers=1)
+
+    assert(len(sent_tokens) == 3)
+    assert(len(set(sent_tokens)) == 3)
+
+
+def _batched_client(post):
+    client = PurviewCollectionsClient(
+        "https://demo.purview.azure.com/", RotatingTokenAuth())
+    client._session.post = post
+    sent_batches = {}
+    post_bulk = client._post_bulk
+
+    def recording_post_bulk(atlas_endpoint, params, batch_id, batch):
+        sent_batches[batch_id] = batch
+        return post_bulk(atlas_endpoint, params, batch_id, batch)
+    client._post_bulk = recording_post_bulk
+    return client, sent_batches
+
+
+def test_upload_entities_batches_keep_order():
+    def post(url, data=None, **kwargs):
+        body = json.loads(data)
+        # The batch holding the first entity answers last
+        if any(e["guid"] == -1 for e in body["entities"]):
+            time.sleep(0.05)
+        return _echo_response({"echo": body})
+    client, sent_batches = _batched_client(post)
+
+    results = client.upload_entities(
+        _sample_entities(10), "abc123", batch_size=3, max_workers=4)
+
+    assert(len(results) == len(sent_batches))
+    assert([r["echo"] for r in results] ==
+           [sent_batches[i] for i in range(len(results))])
+
+
+def test_upload_entities_batches_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def post(url, data=None, **kwargs):
+        # Only passes if two batches are in flight at the same time
+        barrier.wait()
+        return _echo_response({"mutatedEntities": {}})
+    client, _ = _batched_client(post)
+
+    results = client.upload_entities(
+        _sample_entities(4), "abc123", batch_size=2, max_workers=2)
+
+    assert(len(results) == 2)
+
+
+def test_upload_entities_stops_at_failed_batch():
+    calls = []
+
+    def post(url, data=None, **kwargs):
+        calls.append(data)
+        if len(calls) == 1:
+            return _echo_response({"errorCode": "ATLAS-400-00-01A"}, 400)
+        return _echo_response({"mutatedEntities": {}})
+    client, _ = _batched_client(post)
+
+    with pytest.raises(AtlasException):
+        client.upload_entities(
+            _sample_entities(8), "abc123", batch_size=2)
+
+    assert(len(calls) == 1)
+
+
+@pytest.mark.parametrize("max_workers", [None, 0, 1])
+def test_upload_entities_without_max_workers_is_serial(max_workers):
+    in_flight = []
+    overlapped = []
+
+    def post(url, data=None, **kwargs):
+        in_flight.append(data)
+        overlapped.append(len(in_flight) > 1)
+        time.sleep(0.01)
+        in_flight.remove(data)
+        return _echo_response({"echo": json.loads(data)})
+    client, sent_batches = _batched_client(post)
+
+    results = client.upload_entities(
+        _sample_entities(5), "abc123", batch_size=2, max_workers=max_workers)
+
+    assert(not any(overlapped))
+    assert([r["echo"] for r in results] ==
+           [sent_batches[i] for i in range(len(results))])
+
+
+def _paged_client(pages):
+    client = PurviewCollectionsClient(
+        "https://demo.purview.azure.com/", RotatingTokenAuth())
+    requested = []
+
+    def get_page(endpoint):
+        requested.append(endpoint)
+        page = pages[endpoint]
+        if isinstance(page, Exception):
+            raise page
+        return page
+    client._get_collections_page = get_page
+    return client, requested
+
+
+def test_list_collections_generator_follows_next_link():
+    client, requested = _paged_client({
+        "page1": {"value": [{"name": "a"}, {"name": "b"}], "nextLink": "page2"},
+        "page2": {"value": [{"name": "c"}]},
+    })
+
+    results = list(client._list_collections_generator("page1"))
+
+    assert([r["name"] for r in results] == ["a", "b", "c"])
+    assert(requested == ["page1", "page2"])
+
+
+def test_list_collections_generator_stops_on_empty_page():
+    client, requested = _paged_client({
+        "page1": {"value": [{"name": "a"}], "nextLink": "page2"},
+        "page2": {"value": [], "nextLink": "page3"},
+        "page3": {"value": [{"name": "never"}]},
+    })
+
+    results = list(client._list_collections_generator("page1"))
+
+    assert([r["name"] for r in results] == ["a"])
+    assert(requested == ["page1", "page2"])
+
+
+def test_list_collections_generator_raises_prefetch_errors():
+    client, _ = _paged_client({
+        "page1": {"value": [{"name": "a"}], "nextLink": "page2"},
+        "page2": ValueError("Error in parsing"),
+    })
+
+    generator = client._list_collections_generator("page1")
+
+    assert(next(generator)["name"] == "a")
+    with pytest.raises(ValueError):
+        next(generator)
+
+
+def _listing_client(listings):
+    client = PurviewCollectionsClient(
+        "https://demo.purview.azure.com/", RotatingTokenAuth())
+    remaining = list(listings)
+    client._list_collections_generator = lambda endpoint: iter(remaining.pop(0))
+    return client, remaining
+
+
+def test_build_collection_names():
+    results = PurviewCollectionsClient._build_collection_names([
+        {"name": "demo", "friendlyName": "Demo"},
+        {"name": "abc123", "friendlyName": "Sales",
+         "parentCollection": {"referenceName": "demo"}},
+    ])
+
+    assert(results == {
+        "demo": {"friendlyName": "Demo", "index": 0, "parentCollection": None},
+        "abc123": {"friendlyName": "Sales", "index": 1, "parentCollection": "demo"},
+    })
+
+
+def test_list_collections_hierarchy_prints_returned_listing(capsys):
+    client, remaining = _listing_client([
+        [
+            {"name": "demo", "friendlyName": "Demo"},
+            {"name": "abc123", "friendlyName": "Sales",
+             "parentCollection": {"referenceName": "demo"}},
+        ],
+    ])
+
+    collections = client.list_collections_new(hierarchy=True)
+
+    assert([c["friendlyName"] for c in collections] == ["Demo", "Sales"])
+    assert(capsys.readouterr().out.splitlines() == ["Demo", "+-- Sales"])
+    assert(remaining == [])
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+import requests
+
+from pyapacheatlas.core import util
+from pyapacheatlas.core.util import _handle_response
+
+
+def _response(content, status_code=200):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = content
+    resp.encoding = "utf-8"
+    return resp
+
+
+@pytest.mark.parametrize("orjson_installed", [False, True])
+def test_handle_response_keeps_big_integers(monkeypatch, orjson_installed):
+    monkeypatch.setattr(util, "_ORJSON_INSTALLED", orjson_installed)
+
+    results = _handle_response(
+        _response(b'{"a": 123456789012345678901234567890}'))
+
+    assert(results["a"] == 123456789012345678901234567890)
+
+
+@pytest.mark.parametrize("orjson_installed", [False, True])
+def test_handle_response_accepts_nan(monkeypatch, orjson_installed):
+    monkeypatch.setattr(util, "_ORJSON_INSTALLED", orjson_installed)
+
+    results = _handle_response(_response(b'{"a": NaN}'))
+
+    assert(results["a"] != results["a"])
+
+
+@pytest.mark.parametrize("orjson_installed", [False, True])
+def test_json_dumps_encodes_same_payload(monkeypatch, orjson_installed):
+    if orjson_installed:
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(util, "_ORJSON_INSTALLED", orjson_installed)
+    payload = {"entities": [{"name": "café", "quote": 'a "b" \\ c'}], 1: None}
+
+    body = util._json_dumps(payload)
+
+    assert(isinstance(body, bytes))
+    assert(json.loads(body) == json.loads(json.dumps(payload)))